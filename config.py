@@ -1,3 +1,4 @@
+from functools import lru_cache
 from pydantic_settings import BaseSettings
 from typing import Optional
 import os
@@ -10,6 +11,8 @@ class Settings(BaseSettings):
     anthropic_api_key: Optional[str] = None
     openai_model: str = "gpt-4"
     anthropic_model: str = "claude-3-sonnet-20240229"
+    ai_max_concurrency: int = 8  # Concurrent AI requests when resolving selectors in batch
+    ai_prefetch: bool = False  # Resolve upcoming steps' selectors in one batch after navigation
     
     # Azure OpenAI Configuration
     azure_openai_endpoint: Optional[str] = None
@@ -21,9 +24,12 @@ class Settings(BaseSettings):
     headless: bool = True
     browser_type: str = "chromium"  # "chromium", "firefox", "webkit"
     timeout: int = 30000
+    context_recycle_interval: int = 1  # Recycle the browser context every N scenarios (0 = never)
+    blocked_resource_types: str = "image,media,font"  # Comma-separated request resource types to abort
+    parallel_scenarios: int = 1  # Scenarios run concurrently, each in its own browser (1 = serial)
     
     # Cache Configuration
-    cache_file: str = "element_cache.json"
+    cache_file: str = "element_cache.jsonl"
     
     # Logging Configuration
     log_level: str = "INFO"
@@ -33,4 +39,7 @@ class Settings(BaseSettings):
         case_sensitive = False
 
 
-settings = Settings()
\ No newline at end of file
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Return the process-wide settings instance (environment and .env are read once)"""
+    return Settings()
@@ -8,23 +8,30 @@ from pathlib import Path
 from loguru import logger
 
 from src.test_executor import TestExecutor
-from config import settings
+from config import get_settings
 
 
 def setup_logging():
     """Configure logging"""
+    settings = get_settings()
     logger.remove()
     logger.add(
         sys.stdout,
         format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
-        level=settings.log_level
+        level=settings.log_level,
+        # Hand records to a background thread when stdout is a pipe (e.g. CI)
+        enqueue=not sys.stdout.isatty()
     )
     logger.add(
         "logs/test_execution.log",
         format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
         level="DEBUG",
         rotation="10 MB",
-        retention="7 days"
+        retention="7 days",
+        compression="gz",
+        enqueue=True,
+        backtrace=False,
+        diagnose=False
     )
 
 
@@ -38,6 +45,7 @@ def main():
     parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"], default="INFO", help="Log level")
     
     args = parser.parse_args()
+    settings = get_settings()
     
     # Override settings with command line arguments
     if args.headless:
@@ -105,6 +113,9 @@ def main():
     except Exception as e:
         logger.error(f"Test execution failed: {e}")
         sys.exit(1)
+    finally:
+        # Drain queued log records before the process exits
+        logger.complete()
 
 
 if __name__ == "__main__":
@@ -1,42 +1,28 @@
 """
 AI client for element detection and selector generation
 """
+import asyncio
 import json
-from typing import Dict, List, Optional, Any
+import re
+import threading
+from typing import Dict, List, Optional, Any, Tuple
 from abc import ABC, abstractmethod
-import openai
-import anthropic
 from loguru import logger
 import sys
 import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import settings
+from config import get_settings
+from xpath_helpers import XPathHelper
 
+try:
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
 
-class AIClient(ABC):
-    """Abstract base class for AI clients"""
-    
-    @abstractmethod
-    def analyze_dom(self, html_content: str, element_description: str, url: str) -> Dict[str, Any]:
-        """Analyze DOM and return element selector"""
-        pass
 
-
-class OpenAIClient(AIClient):
-    """OpenAI client for element detection"""
-    
-    def __init__(self, api_key: str, model: str = "gpt-4"):
-        # Initialize OpenAI client with explicit parameters to avoid proxy issues
-        self.client = openai.OpenAI(
-            api_key=api_key,
-            timeout=60.0
-        )
-        self.model = model
-    
-    def analyze_dom(self, html_content: str, element_description: str, url: str) -> Dict[str, Any]:
-        """Analyze DOM using OpenAI to find element selector"""
-        
-        system_prompt = """You are an expert at analyzing HTML DOM and finding element selectors.
+SYSTEM_PROMPT = """You are an expert at analyzing HTML DOM and finding element selectors.
 Given HTML content and an element description, find the best XPath or CSS selector for that element.
 
 Rules:
@@ -61,9 +47,25 @@ Return JSON format:
     "error": null
 }"""
 
-        user_prompt = f"""
+# Limit HTML to avoid token limits
+HTML_TRUNC_LEN = 8000
+
+_SCRIPT_RE = re.compile(r'<script[^>]*>.*?</script>', re.DOTALL | re.IGNORECASE)
+_STYLE_RE = re.compile(r'<style[^>]*>.*?</style>', re.DOTALL | re.IGNORECASE)
+_COMMENT_RE = re.compile(r'<!--.*?-->', re.DOTALL)
+# The three blocks above in one pass, so they can be skipped left to right
+_SKIPPED_BLOCK_RE = re.compile(
+    r'<script[^>]*>.*?</script>|<style[^>]*>.*?</style>|<!--.*?-->', re.DOTALL | re.IGNORECASE
+)
+# An opener with no closing tag, e.g. on a page cut off mid-script
+_UNTERMINATED_BLOCK_RE = re.compile(r'(<script\b|<style\b|<!--).*', re.DOTALL | re.IGNORECASE)
+
+
+def _build_user_prompt(html_content: str, element_description: str, url: str) -> str:
+    """Build the user prompt shared by all providers"""
+    return f"""
 HTML Content:
-{html_content[:8000]}  # Limit HTML to avoid token limits
+{html_content}
 
 Element to find: "{element_description}"
 URL: {url}
@@ -71,203 +73,215 @@ URL: {url}
 Find the best selector for this element. Focus on the most reliable approach.
 """
 
+
+def _error_result(error: str) -> Dict[str, Any]:
+    """Build an unsuccessful analysis result"""
+    return {
+        "selectors": [],
+        "best_selector": None,
+        "success": False,
+        "error": error
+    }
+
+
+def _strip_code_fence(content: str) -> str:
+    """Remove a markdown code fence wrapped around a JSON payload"""
+    content = content.strip()
+    if content.startswith("```"):
+        # Drop the opening fence line, including any language tag
+        content = content.split("\n", 1)[1] if "\n" in content else content[3:]
+        if content.endswith("```"):
+            content = content[:-3]
+    return content
+
+
+def _parse_json_result(content: Optional[str], provider: str, element_description: str) -> Dict[str, Any]:
+    """Parse the JSON payload returned by a provider"""
+    if not content:
+        logger.error(f"Empty {provider} response")
+        return _error_result("Empty response")
+    
+    try:
+        result = _json_loads(_strip_code_fence(content))
+    except json.JSONDecodeError as e:
+        logger.error(f"Failed to parse {provider} response: {e}")
+        return _error_result(f"JSON parse error: {str(e)}")
+    
+    logger.info(f"{provider} analysis completed for: {element_description}")
+    return result
+
+
+def _chat_messages(html_content: str, element_description: str, url: str) -> List[Dict[str, str]]:
+    """Build chat completion messages for OpenAI-compatible providers"""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": _build_user_prompt(html_content, element_description, url)}
+    ]
+
+
+class AIClient(ABC):
+    """Abstract base class for AI clients"""
+    
+    @abstractmethod
+    def analyze_dom(self, html_content: str, element_description: str, url: str) -> Dict[str, Any]:
+        """Analyze DOM and return element selector"""
+        pass
+    
+    @abstractmethod
+    async def analyze_dom_async(self, html_content: str, element_description: str, url: str) -> Dict[str, Any]:
+        """Analyze DOM without blocking the event loop"""
+        pass
+
+
+class OpenAIClient(AIClient):
+    """OpenAI client for element detection"""
+    
+    def __init__(self, api_key: str, model: str = "gpt-4"):
+        # Imported here so only the configured provider's SDK is loaded
+        import openai
+        
+        # Initialize OpenAI client with explicit parameters to avoid proxy issues
+        self.client = openai.OpenAI(
+            api_key=api_key,
+            timeout=60.0
+        )
+        self.async_client = openai.AsyncOpenAI(
+            api_key=api_key,
+            timeout=60.0
+        )
+        self.model = model
+    
+    def analyze_dom(self, html_content: str, element_description: str, url: str) -> Dict[str, Any]:
+        """Analyze DOM using OpenAI to find element selector"""
         try:
             response = self.client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
+                messages=_chat_messages(html_content, element_description, url),
                 temperature=0.1,
                 max_tokens=1000
             )
-            
             content = response.choices[0].message.content
-            result = json.loads(content)
-            
-            logger.info(f"OpenAI analysis completed for: {element_description}")
-            return result
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse OpenAI response: {e}")
-            return {
-                "selectors": [],
-                "best_selector": None,
-                "success": False,
-                "error": f"JSON parse error: {str(e)}"
-            }
         except Exception as e:
             logger.error(f"OpenAI API error: {e}")
-            return {
-                "selectors": [],
-                "best_selector": None,
-                "success": False,
-                "error": str(e)
-            }
+            return _error_result(str(e))
+        
+        return _parse_json_result(content, "OpenAI", element_description)
+    
+    async def analyze_dom_async(self, html_content: str, element_description: str, url: str) -> Dict[str, Any]:
+        """Analyze DOM using the async OpenAI client"""
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=_chat_messages(html_content, element_description, url),
+                temperature=0.1,
+                max_tokens=1000
+            )
+            content = response.choices[0].message.content
+        except Exception as e:
+            logger.error(f"OpenAI API error: {e}")
+            return _error_result(str(e))
+        
+        return _parse_json_result(content, "OpenAI", element_description)
 
 
 class AzureOpenAIClient(AIClient):
     """Azure OpenAI client for element detection"""
     
     def __init__(self, api_key: str, endpoint: str, deployment: str, api_version: str = "2024-02-01"):
+        import openai
+        
         self.client = openai.AzureOpenAI(
             api_key=api_key,
             azure_endpoint=endpoint,
             api_version=api_version
         )
+        self.async_client = openai.AsyncAzureOpenAI(
+            api_key=api_key,
+            azure_endpoint=endpoint,
+            api_version=api_version
+        )
         self.deployment = deployment
     
     def analyze_dom(self, html_content: str, element_description: str, url: str) -> Dict[str, Any]:
         """Analyze DOM using Azure OpenAI to find element selector"""
-        
-        system_prompt = """You are an expert at analyzing HTML DOM and finding element selectors.
-Given HTML content and an element description, find the best XPath or CSS selector for that element.
-
-Rules:
-1. Prefer XPath selectors over CSS selectors
-2. Use text-based selectors when possible (e.g., //button[text()='Submit'])
-3. Avoid fragile selectors like absolute paths or index-based selectors
-4. Return multiple selector options ranked by reliability
-5. Include confidence score (0-1) for each selector
-
-Return JSON format:
-{
-    "selectors": [
-        {
-            "selector": "//button[text()='Submit']",
-            "type": "xpath",
-            "confidence": 0.9,
-            "reasoning": "Direct text match for button"
-        }
-    ],
-    "best_selector": "//button[text()='Submit']",
-    "success": true,
-    "error": null
-}"""
-
-        user_prompt = f"""
-HTML Content:
-{html_content[:8000]}  # Limit HTML to avoid token limits
-
-Element to find: "{element_description}"
-URL: {url}
-
-Find the best selector for this element. Focus on the most reliable approach.
-"""
-
         try:
             response = self.client.chat.completions.create(
                 model=self.deployment,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
+                messages=_chat_messages(html_content, element_description, url),
                 temperature=0.1,
                 max_tokens=1000
             )
-            
             content = response.choices[0].message.content
-            result = json.loads(content)
-            
-            logger.info(f"Azure OpenAI analysis completed for: {element_description}")
-            return result
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse Azure OpenAI response: {e}")
-            return {
-                "selectors": [],
-                "best_selector": None,
-                "success": False,
-                "error": f"JSON parse error: {str(e)}"
-            }
         except Exception as e:
             logger.error(f"Azure OpenAI API error: {e}")
-            return {
-                "selectors": [],
-                "best_selector": None,
-                "success": False,
-                "error": str(e)
-            }
+            return _error_result(str(e))
+        
+        return _parse_json_result(content, "Azure OpenAI", element_description)
+    
+    async def analyze_dom_async(self, html_content: str, element_description: str, url: str) -> Dict[str, Any]:
+        """Analyze DOM using the async Azure OpenAI client"""
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=self.deployment,
+                messages=_chat_messages(html_content, element_description, url),
+                temperature=0.1,
+                max_tokens=1000
+            )
+            content = response.choices[0].message.content
+        except Exception as e:
+            logger.error(f"Azure OpenAI API error: {e}")
+            return _error_result(str(e))
+        
+        return _parse_json_result(content, "Azure OpenAI", element_description)
 
 
 class AnthropicClient(AIClient):
     """Anthropic client for element detection"""
     
     def __init__(self, api_key: str, model: str = "claude-3-sonnet-20240229"):
+        import anthropic
+        
         self.client = anthropic.Anthropic(api_key=api_key)
+        self.async_client = anthropic.AsyncAnthropic(api_key=api_key)
         self.model = model
     
     def analyze_dom(self, html_content: str, element_description: str, url: str) -> Dict[str, Any]:
         """Analyze DOM using Anthropic to find element selector"""
-        
-        system_prompt = """You are an expert at analyzing HTML DOM and finding element selectors.
-Given HTML content and an element description, find the best XPath or CSS selector for that element.
-
-Rules:
-1. Prefer XPath selectors over CSS selectors
-2. Use text-based selectors when possible (e.g., //button[text()='Submit'])
-3. Avoid fragile selectors like absolute paths or index-based selectors
-4. Return multiple selector options ranked by reliability
-5. Include confidence score (0-1) for each selector
-
-Return JSON format:
-{
-    "selectors": [
-        {
-            "selector": "//button[text()='Submit']",
-            "type": "xpath",
-            "confidence": 0.9,
-            "reasoning": "Direct text match for button"
-        }
-    ],
-    "best_selector": "//button[text()='Submit']",
-    "success": true,
-    "error": null
-}"""
-
-        user_prompt = f"""
-HTML Content:
-{html_content[:8000]}  # Limit HTML to avoid token limits
-
-Element to find: "{element_description}"
-URL: {url}
-
-Find the best selector for this element. Focus on the most reliable approach.
-"""
-
         try:
             response = self.client.messages.create(
                 model=self.model,
                 max_tokens=1000,
                 temperature=0.1,
-                system=system_prompt,
+                system=SYSTEM_PROMPT,
                 messages=[
-                    {"role": "user", "content": user_prompt}
+                    {"role": "user", "content": _build_user_prompt(html_content, element_description, url)}
                 ]
             )
-            
             content = response.content[0].text
-            result = json.loads(content)
-            
-            logger.info(f"Anthropic analysis completed for: {element_description}")
-            return result
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse Anthropic response: {e}")
-            return {
-                "selectors": [],
-                "best_selector": None,
-                "success": False,
-                "error": f"JSON parse error: {str(e)}"
-            }
         except Exception as e:
             logger.error(f"Anthropic API error: {e}")
-            return {
-                "selectors": [],
-                "best_selector": None,
-                "success": False,
-                "error": str(e)
-            }
+            return _error_result(str(e))
+        
+        return _parse_json_result(content, "Anthropic", element_description)
+    
+    async def analyze_dom_async(self, html_content: str, element_description: str, url: str) -> Dict[str, Any]:
+        """Analyze DOM using the async Anthropic client"""
+        try:
+            response = await self.async_client.messages.create(
+                model=self.model,
+                max_tokens=1000,
+                temperature=0.1,
+                system=SYSTEM_PROMPT,
+                messages=[
+                    {"role": "user", "content": _build_user_prompt(html_content, element_description, url)}
+                ]
+            )
+            content = response.content[0].text
+        except Exception as e:
+            logger.error(f"Anthropic API error: {e}")
+            return _error_result(str(e))
+        
+        return _parse_json_result(content, "Anthropic", element_description)
 
 
 class AIElementDetector:
@@ -275,40 +289,129 @@ class AIElementDetector:
     
     def __init__(self):
         self.client = self._initialize_client()
+        self.max_concurrency = get_settings().ai_max_concurrency
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+        # Shared by all batches so concurrent scenarios stay within max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        
+        # Results for this process, keyed by (url, element description)
+        self._memo: Dict[Tuple[str, str], Dict[str, Any]] = {}
     
     def _initialize_client(self) -> AIClient:
         """Initialize AI client based on configuration"""
-        if settings.ai_provider == "openai":
-            if not settings.openai_api_key:
+        settings = get_settings()
+        provider = settings.ai_provider
+        if provider == "openai":
+            api_key = settings.openai_api_key
+            if not api_key:
                 raise ValueError("OpenAI API key not configured")
-            return OpenAIClient(settings.openai_api_key, settings.openai_model)
-        elif settings.ai_provider == "azure_openai":
-            if not settings.azure_openai_api_key or not settings.azure_openai_endpoint or not settings.azure_openai_deployment:
+            return OpenAIClient(api_key, settings.openai_model)
+        elif provider == "azure_openai":
+            api_key = settings.azure_openai_api_key
+            endpoint = settings.azure_openai_endpoint
+            deployment = settings.azure_openai_deployment
+            if not api_key or not endpoint or not deployment:
                 raise ValueError("Azure OpenAI configuration incomplete. Need: api_key, endpoint, deployment")
             return AzureOpenAIClient(
-                settings.azure_openai_api_key,
-                settings.azure_openai_endpoint,
-                settings.azure_openai_deployment,
+                api_key,
+                endpoint,
+                deployment,
                 settings.azure_openai_api_version
             )
-        elif settings.ai_provider == "anthropic":
-            if not settings.anthropic_api_key:
+        elif provider == "anthropic":
+            api_key = settings.anthropic_api_key
+            if not api_key:
                 raise ValueError("Anthropic API key not configured")
-            return AnthropicClient(settings.anthropic_api_key, settings.anthropic_model)
+            return AnthropicClient(api_key, settings.anthropic_model)
         else:
-            raise ValueError(f"Unsupported AI provider: {settings.ai_provider}")
+            raise ValueError(f"Unsupported AI provider: {provider}")
     
     def find_element_selector(self, html_content: str, element_description: str, url: str) -> Dict[str, Any]:
         """Find element selector using AI analysis"""
+        key = (url, element_description)
+        hit = self._memo.get(key)
+        if hit is not None:
+            return hit
+        
         logger.info(f"Analyzing element: {element_description}")
         
-        # Clean HTML content
-        cleaned_html = self._clean_html(html_content)
+        result = self.client.analyze_dom(self._prepare_html(html_content), element_description, url)
+        result = self._finalize_result(result, element_description)
+        self._memo[key] = result
+        return result
+    
+    async def find_element_selector_async(self, html_content: str, element_description: str, url: str) -> Dict[str, Any]:
+        """Find element selector using the provider's async client"""
+        key = (url, element_description)
+        hit = self._memo.get(key)
+        if hit is not None:
+            return hit
         
-        # Get AI analysis
-        result = self.client.analyze_dom(cleaned_html, element_description, url)
+        logger.info(f"Analyzing element: {element_description}")
         
-        # Enhance with fallback selectors if AI failed
+        result = await self.client.analyze_dom_async(self._prepare_html(html_content), element_description, url)
+        result = self._finalize_result(result, element_description)
+        self._memo[key] = result
+        return result
+    
+    def is_memoized(self, url: str, element_description: str) -> bool:
+        """Check whether a lookup would be answered without calling the AI provider"""
+        return (url, element_description) in self._memo
+    
+    def forget(self, url: str, element_description: str) -> None:
+        """Drop a memoized result, e.g. when its selector did not match the page"""
+        self._memo.pop((url, element_description), None)
+    
+    def find_element_selectors_batch(self, items: List[Tuple[str, str, str]]) -> List[Dict[str, Any]]:
+        """Find selectors for several (html_content, element_description, url) items concurrently"""
+        if not items:
+            return []
+        
+        future = asyncio.run_coroutine_threadsafe(self._gather_selectors(items), self._get_loop())
+        return future.result()
+    
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        """Return the detector's event loop, starting its background thread on first use"""
+        # Playwright's sync API leaves its own loop running on the calling thread, so the
+        # batch loop lives on a dedicated thread; keeping it for the detector's lifetime
+        # also keeps the async SDK clients bound to one loop
+        with self._loop_lock:
+            if self._loop is None or self._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="ai-detector-loop", daemon=True).start()
+                self._loop = loop
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            return self._loop
+    
+    async def _gather_selectors(self, items: List[Tuple[str, str, str]]) -> List[Dict[str, Any]]:
+        """Run AI lookups concurrently, bounded by max_concurrency"""
+        async def find_one(html_content: str, element_description: str, url: str) -> Dict[str, Any]:
+            async with self._semaphore:
+                return await self.find_element_selector_async(html_content, element_description, url)
+        
+        return await asyncio.gather(*(find_one(*item) for item in items))
+    
+    def _prepare_html(self, html_content: str) -> str:
+        """Clean and truncate HTML before sending it to the AI client"""
+        # Skip blocks left to right and stop once HTML_TRUNC_LEN characters are kept, so a
+        # large page is not cleaned in full and a long script is never cut in half and kept
+        parts = []
+        kept = 0
+        position = 0
+        for match in _SKIPPED_BLOCK_RE.finditer(html_content):
+            parts.append(html_content[position:match.start()])
+            kept += match.start() - position
+            position = match.end()
+            if kept >= HTML_TRUNC_LEN:
+                break
+        else:
+            # No complete block follows, so any opener left here is never closed
+            parts.append(_UNTERMINATED_BLOCK_RE.sub('', html_content[position:], count=1))
+        return "".join(parts)[:HTML_TRUNC_LEN]
+    
+    def _finalize_result(self, result: Dict[str, Any], element_description: str) -> Dict[str, Any]:
+        """Enhance with fallback selectors if AI failed"""
         if not result["success"] or not result["best_selector"]:
             result = self._add_fallback_selectors(result, element_description)
         
@@ -316,17 +419,14 @@ class AIElementDetector:
     
     def _clean_html(self, html_content: str) -> str:
         """Clean HTML content to focus on interactive elements"""
-        # Remove script and style tags
-        import re
-        
         # Remove script tags
-        html_content = re.sub(r'<script[^>]*>.*?</script>', '', html_content, flags=re.DOTALL | re.IGNORECASE)
+        html_content = _SCRIPT_RE.sub('', html_content)
         
-        # Remove style tags  
-        html_content = re.sub(r'<style[^>]*>.*?</style>', '', html_content, flags=re.DOTALL | re.IGNORECASE)
+        # Remove style tags
+        html_content = _STYLE_RE.sub('', html_content)
         
         # Remove comments
-        html_content = re.sub(r'<!--.*?-->', '', html_content, flags=re.DOTALL)
+        html_content = _COMMENT_RE.sub('', html_content)
         
         # Keep only interactive elements and their context
         # This is a simplified approach - in production, you might want more sophisticated HTML parsing
@@ -335,24 +435,21 @@ class AIElementDetector:
     
     def _add_fallback_selectors(self, result: Dict[str, Any], element_description: str) -> Dict[str, Any]:
         """Add fallback selectors when AI analysis fails"""
-        from xpath_helpers import XPathHelper
-        
         fallback_selectors = XPathHelper.generate_xpath_variations(element_description)
         
-        fallback_list = []
-        for selector in fallback_selectors:
-            fallback_list.append({
+        result["selectors"].extend(
+            {
                 "selector": selector,
                 "type": "xpath",
                 "confidence": 0.5,
                 "reasoning": "Fallback pattern-based selector"
-            })
-        
-        result["selectors"].extend(fallback_list)
+            }
+            for selector in fallback_selectors
+        )
         
         # Set best selector to first fallback if none exists
-        if not result["best_selector"] and fallback_list:
-            result["best_selector"] = fallback_list[0]["selector"]
+        if not result["best_selector"] and fallback_selectors:
+            result["best_selector"] = fallback_selectors[0]
             result["success"] = True
         
         return result
\ No newline at end of file
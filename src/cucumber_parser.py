@@ -2,13 +2,18 @@
 Cucumber/Gherkin parser to extract test steps and elements
 """
 import re
-from typing import List, Dict, Optional, Tuple
+from collections import Counter
+from typing import Iterable, List, Dict, Optional, Set, Tuple, Union
 from pathlib import Path
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
 from loguru import logger
 
 
-@dataclass
+_STEP_LINE_RE = re.compile(r'^(given|when|then|and|but)(?:\s+(.*))?$', re.IGNORECASE)
+_QUOTED_RE = re.compile(r'["\']([^"\']+)["\']')
+
+
+@dataclass(slots=True, frozen=True)
 class TestStep:
     """Represents a single test step"""
     step_type: str  # Given, When, Then, And, But
@@ -18,7 +23,7 @@ class TestStep:
     expected_text: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class TestScenario:
     """Represents a test scenario"""
     name: str
@@ -27,6 +32,24 @@ class TestScenario:
     background_steps: List[TestStep] = None
 
 
+@dataclass(slots=True)
+class ParsedFeature:
+    """Parsed scenarios plus flat per-step columns for bulk queries"""
+    scenarios: List[TestScenario] = field(default_factory=list)
+    element_descriptions: List[str] = field(default_factory=list)
+    actions: List[str] = field(default_factory=list)
+    
+    def add_scenario(self, scenario: TestScenario) -> None:
+        """Append a scenario and record its steps (background first) in the columns"""
+        self.scenarios.append(scenario)
+        for steps in (scenario.background_steps or (), scenario.steps):
+            for step in steps:
+                if step.element_description:
+                    self.element_descriptions.append(step.element_description)
+                if step.action:
+                    self.actions.append(step.action)
+
+
 class CucumberParser:
     """Parser for Cucumber/Gherkin feature files"""
     
@@ -44,6 +67,16 @@ class CucumberParser:
             'check': r'check\s+(?:the\s+)?(.+)',
             'uncheck': r'uncheck\s+(?:the\s+)?(.+)',
         }
+        self._compiled_patterns = [
+            (action, re.compile(pattern)) for action, pattern in self.action_patterns.items()
+        ]
+    
+    def parse_feature(self, file_path: str) -> ParsedFeature:
+        """Parse a Cucumber feature file into scenarios and step columns"""
+        feature = ParsedFeature()
+        for scenario in self.parse_feature_file(file_path):
+            feature.add_scenario(scenario)
+        return feature
     
     def parse_feature_file(self, file_path: str) -> List[TestScenario]:
         """Parse a Cucumber feature file"""
@@ -52,14 +85,15 @@ class CucumberParser:
             raise FileNotFoundError(f"Feature file not found: {file_path}")
         
         with open(path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        return self.parse_feature_content(content)
+            return self._parse_lines(f)
     
     def parse_feature_content(self, content: str) -> List[TestScenario]:
         """Parse Cucumber feature content"""
+        return self._parse_lines(content.splitlines())
+    
+    def _parse_lines(self, lines: Iterable[str]) -> List[TestScenario]:
+        """Parse Cucumber feature lines, consuming them one at a time"""
         scenarios = []
-        lines = content.split('\n')
         
         current_scenario = None
         current_steps = []
@@ -78,16 +112,27 @@ class CucumberParser:
                 current_tags.extend(line.split())
                 continue
             
+            # Steps
+            step_match = _STEP_LINE_RE.match(line)
+            if step_match:
+                step = self._parse_step(step_match.group(1), step_match.group(2))
+                if in_background:
+                    background_steps.append(step)
+                else:
+                    current_steps.append(step)
+                continue
+            
+            line_lower = line.lower()
+            
             # Background
-            if line.lower().startswith('background:'):
+            if line_lower.startswith('background:'):
                 in_background = True
                 continue
             
             # Scenario
-            if line.lower().startswith('scenario:') or line.lower().startswith('scenario outline:'):
+            if line_lower.startswith('scenario:') or line_lower.startswith('scenario outline:'):
                 if current_scenario and current_steps:
-                    current_scenario.steps = current_steps
-                    scenarios.append(current_scenario)
+                    scenarios.append(replace(current_scenario, steps=current_steps))
                 
                 scenario_name = line.split(':', 1)[1].strip()
                 current_scenario = TestScenario(
@@ -99,37 +144,20 @@ class CucumberParser:
                 current_steps = []
                 current_tags = []
                 in_background = False
-                continue
-            
-            # Steps
-            if self._is_step_line(line):
-                step = self._parse_step(line)
-                if in_background:
-                    background_steps.append(step)
-                else:
-                    current_steps.append(step)
         
         # Add the last scenario
         if current_scenario and current_steps:
-            current_scenario.steps = current_steps
-            scenarios.append(current_scenario)
+            scenarios.append(replace(current_scenario, steps=current_steps))
         
         logger.info(f"Parsed {len(scenarios)} scenarios")
         return scenarios
     
-    def _is_step_line(self, line: str) -> bool:
-        """Check if line is a test step"""
-        step_keywords = ['given', 'when', 'then', 'and', 'but']
-        return any(line.lower().startswith(keyword) for keyword in step_keywords)
-    
-    def _parse_step(self, line: str) -> TestStep:
-        """Parse a single test step"""
-        parts = line.split(None, 1)
-        if len(parts) < 2:
-            return TestStep(step_type=parts[0], step_text=line)
+    def _parse_step(self, keyword: str, step_text: Optional[str]) -> TestStep:
+        """Parse a single test step from its keyword and text"""
+        if not step_text:
+            return TestStep(step_type=keyword, step_text=keyword)
         
-        step_type = parts[0].lower()
-        step_text = parts[1]
+        step_type = keyword.lower()
         
         # Extract action and element from step text
         action, element_description, expected_text = self._extract_action_and_element(step_text)
@@ -146,8 +174,8 @@ class CucumberParser:
         """Extract action, element description, and expected text from step"""
         step_lower = step_text.lower()
         
-        for action, pattern in self.action_patterns.items():
-            match = re.search(pattern, step_lower)
+        for action, pattern in self._compiled_patterns:
+            match = pattern.search(step_lower)
             if match:
                 groups = match.groups()
                 
@@ -168,44 +196,39 @@ class CucumberParser:
                     return action, element_description, expected_text
         
         # If no pattern matches, try to extract quoted text as element
-        quoted_matches = re.findall(r'["\']([^"\']+)["\']', step_text)
+        quoted_matches = _QUOTED_RE.findall(step_text)
         if quoted_matches:
             return None, quoted_matches[0], None
         
         return None, None, None
     
-    def get_all_elements(self, scenarios: List[TestScenario]) -> List[str]:
-        """Get all unique element descriptions from scenarios"""
+    def summarise(self, scenarios: List[TestScenario]) -> Tuple[Set[str], Dict[str, int]]:
+        """Collect unique element descriptions and action counts in a single pass"""
         elements = set()
+        actions = []
         
         for scenario in scenarios:
-            # Background steps
-            if scenario.background_steps:
-                for step in scenario.background_steps:
+            # Background steps, then scenario steps
+            for steps in (scenario.background_steps or (), scenario.steps):
+                for step in steps:
                     if step.element_description:
                         elements.add(step.element_description)
-            
-            # Scenario steps
-            for step in scenario.steps:
-                if step.element_description:
-                    elements.add(step.element_description)
+                    if step.action:
+                        actions.append(step.action)
         
+        # Counter tallies the collected actions in C
+        return elements, Counter(actions)
+    
+    def get_all_elements(self, scenarios: Union[List[TestScenario], ParsedFeature]) -> List[str]:
+        """Get all unique element descriptions from scenarios"""
+        if isinstance(scenarios, ParsedFeature):
+            return list(set(scenarios.element_descriptions))
+        elements, _ = self.summarise(scenarios)
         return list(elements)
     
-    def get_actions_summary(self, scenarios: List[TestScenario]) -> Dict[str, int]:
+    def get_actions_summary(self, scenarios: Union[List[TestScenario], ParsedFeature]) -> Dict[str, int]:
         """Get summary of all actions in scenarios"""
-        actions = {}
-        
-        for scenario in scenarios:
-            # Background steps
-            if scenario.background_steps:
-                for step in scenario.background_steps:
-                    if step.action:
-                        actions[step.action] = actions.get(step.action, 0) + 1
-            
-            # Scenario steps
-            for step in scenario.steps:
-                if step.action:
-                    actions[step.action] = actions.get(step.action, 0) + 1
-        
+        if isinstance(scenarios, ParsedFeature):
+            return Counter(scenarios.actions)
+        _, actions = self.summarise(scenarios)
         return actions
\ No newline at end of file
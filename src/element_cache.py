@@ -1,25 +1,52 @@
 """
 Element selector cache for storing successful xpath/CSS selectors
+
+Entries are persisted as an append-only JSON Lines log: every set() appends
+one record and load_cache() replays the log (last write wins per key).
+Records carry their url and element description, from which the in-memory
+key is rebuilt on load.
 """
-import json
-import hashlib
-from typing import Dict, Optional, Any
+import atexit
+import os
+import threading
+import time
+from typing import Dict, Optional, Any, BinaryIO, Tuple
 from pathlib import Path
 from loguru import logger
 
+try:
+    import orjson
+
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+except ImportError:
+    import json
+
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+    _loads = json.loads
+
 
 class ElementCache:
     """Cache for storing successful element selectors"""
     
-    def __init__(self, cache_file: str = "element_cache.json"):
+    def __init__(self, cache_file: str = "element_cache.jsonl", flush_interval: float = 2.0):
         self.cache_file = Path(cache_file)
-        self.cache: Dict[str, Dict[str, Any]] = {}
+        self.cache: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.flush_interval = flush_interval
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        self._append_fh: Optional[BinaryIO] = None
+        self._log_lines = 0
+        # Guards the in-memory dicts and the log file when scenarios run in parallel
+        self._lock = threading.RLock()
         self.load_cache()
+        atexit.register(self.close)
     
-    def _generate_key(self, url: str, element_description: str) -> str:
+    def _generate_key(self, url: str, element_description: str) -> Tuple[str, str]:
         """Generate unique key for caching"""
-        combined = f"{url}::{element_description.lower().strip()}"
-        return hashlib.md5(combined.encode()).hexdigest()
+        return (url, element_description.lower().strip())
     
     def get(self, url: str, element_description: str) -> Optional[Dict[str, Any]]:
         """Get cached selector for element"""
@@ -46,44 +73,152 @@ class ElementCache:
             "metadata": metadata or {}
         }
         
-        self.cache[key] = entry
-        self.save_cache()
+        with self._lock:
+            self.cache[key] = entry
+            self._append_record(entry)
+            self._maybe_compact()
         
         logger.info(f"Cached selector for: {element_description} -> {selector}")
     
+    def _maybe_compact(self) -> None:
+        """Compact the log once it holds more than twice the live records"""
+        if self._log_lines > 2 * len(self.cache):
+            self.compact()
+    
+    def _append_record(self, entry: Dict[str, Any]) -> None:
+        """Append a single entry to the cache log"""
+        try:
+            if self._append_fh is None:
+                self._append_fh = open(self.cache_file, 'ab')
+            self._append_fh.write(_dumps(entry) + b"\n")
+            self._log_lines += 1
+            self._dirty = True
+            self._maybe_flush()
+        except Exception as e:
+            logger.error(f"Error appending to cache: {e}")
+    
+    def _maybe_flush(self) -> None:
+        """Flush pending appends if the flush interval has elapsed"""
+        if self._dirty and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+    
+    def flush(self) -> None:
+        """Flush pending appends to disk"""
+        with self._lock:
+            if self._dirty and self._append_fh is not None:
+                try:
+                    self._append_fh.flush()
+                except Exception as e:
+                    logger.error(f"Error flushing cache: {e}")
+            self._dirty = False
+            self._last_flush = time.monotonic()
+    
+    def close(self) -> None:
+        """Flush and close the cache log"""
+        with self._lock:
+            self.flush()
+            if self._append_fh is not None:
+                self._append_fh.close()
+                self._append_fh = None
+    
     def load_cache(self) -> None:
-        """Load cache from file"""
+        """Load cache by replaying the log file"""
+        self.cache = {}
+        self._log_lines = 0
         try:
             if self.cache_file.exists():
-                with open(self.cache_file, 'r') as f:
-                    self.cache = json.load(f)
+                with open(self.cache_file, 'rb') as f:
+                    data = f.read()
+                
+                legacy = self._parse_legacy(data)
+                if legacy is not None:
+                    for entry in legacy.values():
+                        self._load_record(entry)
+                    logger.info(f"Migrating {len(self.cache)} entries from the JSON cache format")
+                    self.save_cache()
+                    return
+                
+                lines = [line for line in data.splitlines() if line.strip()]
+                torn_tail = False
+                for position, line in enumerate(lines):
+                    try:
+                        record = _loads(line)
+                    except ValueError:
+                        record = None
+                    if not isinstance(record, dict):
+                        logger.warning("Skipping unreadable cache record")
+                        torn_tail = position == len(lines) - 1
+                        continue
+                    self._load_record(record)
                 logger.info(f"Loaded cache with {len(self.cache)} entries")
+                
+                # A crash mid-append can leave a torn last line; rewrite the log so new
+                # appends don't land on the end of it, unless nothing was readable at all
+                if torn_tail and self._log_lines:
+                    self.compact()
             else:
-                self.cache = {}
                 logger.info("No cache file found, starting fresh")
         except Exception as e:
             logger.error(f"Error loading cache: {e}")
             self.cache = {}
+            self._log_lines = 0
     
-    def save_cache(self) -> None:
-        """Save cache to file"""
+    def _parse_legacy(self, data: bytes) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Return the entries of a cache written as one JSON object, or None for a log"""
         try:
-            with open(self.cache_file, 'w') as f:
-                json.dump(self.cache, f, indent=2)
-            logger.debug(f"Saved cache with {len(self.cache)} entries")
-        except Exception as e:
-            logger.error(f"Error saving cache: {e}")
+            parsed = _loads(data)
+        except ValueError:
+            return None
+        # A single-line log is also an object, but its values are not all entries
+        if isinstance(parsed, dict) and all(isinstance(value, dict) for value in parsed.values()):
+            return parsed
+        return None
+    
+    def _load_record(self, record: Dict[str, Any]) -> None:
+        """Replay one log record into the in-memory cache"""
+        record.pop("key", None)
+        if "hint" in record:
+            # Written by earlier versions; dropped at the next compaction
+            return
+        if "url" not in record or "element_description" not in record:
+            logger.warning("Skipping incomplete cache record")
+            return
+        key = self._generate_key(record["url"], record["element_description"])
+        self.cache[key] = record
+        self._log_lines += 1
+    
+    def save_cache(self) -> None:
+        """Rewrite the cache file from the in-memory entries"""
+        with self._lock:
+            self.close()
+            tmp_file = self.cache_file.with_name(self.cache_file.name + ".tmp")
+            try:
+                with open(tmp_file, 'wb') as f:
+                    for entry in self.cache.values():
+                        f.write(_dumps(entry) + b"\n")
+                os.replace(tmp_file, self.cache_file)
+                self._log_lines = len(self.cache)
+                logger.debug(f"Saved cache with {len(self.cache)} entries")
+            except Exception as e:
+                logger.error(f"Error saving cache: {e}")
+    
+    def compact(self) -> None:
+        """Drop superseded records from the cache log"""
+        logger.debug(f"Compacting cache log ({self._log_lines} records, {len(self.cache)} entries)")
+        self.save_cache()
     
     def clear_cache(self) -> None:
         """Clear all cached entries"""
-        self.cache = {}
-        self.save_cache()
+        with self._lock:
+            self.cache = {}
+            self.save_cache()
         logger.info("Cache cleared")
     
     def get_stats(self) -> Dict[str, Any]:
         """Get cache statistics"""
+        self.flush()
         return {
             "total_entries": len(self.cache),
             "cache_file": str(self.cache_file),
             "cache_size_bytes": self.cache_file.stat().st_size if self.cache_file.exists() else 0
-        }
\ No newline at end of file
+        }
@@ -1,28 +1,149 @@
 """
 Playwright controller for page navigation and element interactions
 """
-from typing import Optional, Dict, Any, List
-from playwright.sync_api import sync_playwright, Browser, BrowserContext, Page
+import atexit
+import re
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Optional, Dict, Any, Iterator, List, Callable, Union
+from playwright.sync_api import sync_playwright, Playwright, Browser, BrowserContext, Page, Locator, Route
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
 from loguru import logger
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import settings
+from config import get_settings
+
+
+_FIRST_MATCHING_XPATH_JS = """(xpaths) => {
+    for (let i = 0; i < xpaths.length; i++) {
+        try {
+            const result = document.evaluate(xpaths[i], document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null);
+            if (result.singleNodeValue) {
+                return i;
+            }
+        } catch (e) {
+            // Invalid expression: try the next candidate
+        }
+    }
+    return -1;
+}"""
+
+# ANY_UNORDERED_NODE_TYPE lets the XPath engine stop at the first hit
+_EXISTS_XPATH_JS = """(xpath) => document.evaluate(
+    xpath, document, null, XPathResult.ANY_UNORDERED_NODE_TYPE, null
+).singleNodeValue !== null"""
+
+# Serializes only interactive elements (plus labels) as attribute-trimmed HTML
+_INTERACTIVE_DOM_JS = """() => {
+    const attributes = ["id", "name", "class", "type", "placeholder", "role", "href", "aria-label", "value", "for"];
+    const escape = (value) => value.replace(/&/g, "&amp;").replace(/"/g, "&quot;").replace(/</g, "&lt;");
+    const elements = document.querySelectorAll(
+        "button, a, input, select, textarea, label, [role=button], [contenteditable]"
+    );
+    const lines = [];
+    for (const element of elements) {
+        const tag = element.tagName.toLowerCase();
+        let html = "<" + tag;
+        for (const name of attributes) {
+            const value = element.getAttribute(name);
+            if (value) {
+                html += " " + name + '="' + escape(value) + '"';
+            }
+        }
+        const text = (element.innerText || "").trim().slice(0, 100);
+        lines.push(html + ">" + escape(text) + "</" + tag + ">");
+    }
+    return lines.join("\\n");
+}"""
+
+
+_playwright: Optional[Playwright] = None
+
+
+def _get_playwright() -> Playwright:
+    """Return the process-wide Playwright driver, starting it on first use"""
+    global _playwright
+    if _playwright is None:
+        _playwright = sync_playwright().start()
+        atexit.register(_shutdown_playwright)
+    return _playwright
+
+
+def _shutdown_playwright() -> None:
+    """Stop the process-wide Playwright driver"""
+    global _playwright
+    if _playwright is not None:
+        try:
+            _playwright.stop()
+        except Exception as e:
+            logger.error(f"Error stopping Playwright: {e}")
+        _playwright = None
+
+
+# Builds a locator for a page, e.g. lambda page: page.get_by_role("button", name="Login")
+LocatorFactory = Callable[[Page], Locator]
+Selector = Union[str, LocatorFactory]
 
 
 class PlaywrightController:
     """Controller for Playwright browser automation"""
     
     def __init__(self):
-        self.playwright = None
+        self.playwright: Optional[Playwright] = None
+        # Only a driver started for this controller is stopped by close_browser
+        self._owns_playwright = False
         self.browser: Optional[Browser] = None
         self.context: Optional[BrowserContext] = None
         self.page: Optional[Page] = None
+        
+        # Locators are bound to self.page; the cache is cleared whenever the page changes
+        self._locator = lru_cache(maxsize=512)(self._build_locator)
+    
+    def __enter__(self) -> "PlaywrightController":
+        self.start_browser()
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.close_browser()
+    
+    def _build_locator(self, selector: Selector, selector_type: str = "xpath") -> Locator:
+        """Build a locator for the current page"""
+        if callable(selector):
+            return selector(self.page)
+        if selector_type == "role":
+            # "role:name" selectors use Playwright's accessibility-tree lookup
+            role, _, name = selector.partition(":")
+            # Whole-name match, ignoring case: step descriptions are parsed lowercase
+            return self.page.get_by_role(role, name=re.compile(rf"^{re.escape(name)}$", re.IGNORECASE))
+        if selector_type == "xpath":
+            return self.page.locator(f"xpath={selector}")
+        return self.page.locator(selector)
+    
+    def _use_page(self, page: Optional[Page]) -> None:
+        """Make page the active page and reset the state bound to it"""
+        self.page = page
+        self._locator.cache_clear()
+    
+    def _new_page(self) -> Page:
+        """Open a page in the current context with the configured timeout"""
+        page = self.context.new_page()
+        page.set_default_timeout(get_settings().timeout)
+        return page
     
     def start_browser(self) -> None:
         """Start browser and create context"""
+        settings = get_settings()
         try:
-            self.playwright = sync_playwright().start()
+            # The sync API is bound to the thread that started it: the main thread shares one
+            # driver across controllers, parallel worker threads start their own
+            if threading.current_thread() is threading.main_thread():
+                self.playwright = _get_playwright()
+                self._owns_playwright = False
+            else:
+                self.playwright = sync_playwright().start()
+                self._owns_playwright = True
             
             # Choose browser type
             if settings.browser_type == "firefox":
@@ -32,15 +153,7 @@ class PlaywrightController:
             else:
                 self.browser = self.playwright.chromium.launch(headless=settings.headless)
             
-            # Create context
-            self.context = self.browser.new_context(
-                viewport={"width": 1920, "height": 1080},
-                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-            )
-            
-            # Create page
-            self.page = self.context.new_page()
-            self.page.set_default_timeout(settings.timeout)
+            self._open_context()
             
             logger.info(f"Browser started: {settings.browser_type}")
             
@@ -48,6 +161,50 @@ class PlaywrightController:
             logger.error(f"Failed to start browser: {e}")
             raise
     
+    def _open_context(self, storage_state: Optional[Dict[str, Any]] = None) -> None:
+        """Create a browser context and its page"""
+        # Create context
+        self.context = self.browser.new_context(
+            viewport={"width": 1920, "height": 1080},
+            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+            storage_state=storage_state
+        )
+        
+        # Skip subresources that element detection does not need
+        blocked = {t.strip() for t in get_settings().blocked_resource_types.split(",") if t.strip()}
+        if blocked:
+            def block_resources(route: Route) -> None:
+                if route.request.resource_type in blocked:
+                    route.abort()
+                else:
+                    route.continue_()
+            
+            self.context.route("**/*", block_resources)
+        
+        # Create page
+        self._use_page(self._new_page())
+    
+    def recycle_context(self) -> None:
+        """Replace the browser context, carrying over cookies and local storage"""
+        try:
+            if not self.browser or not self.context:
+                return
+            
+            # Closing the context is what releases its pages' memory
+            state = self.context.storage_state()
+            if self.page:
+                self.page.close()
+            self.context.close()
+            self._open_context(storage_state=state)
+            
+            logger.debug("Browser context recycled")
+            
+        except Exception as e:
+            logger.error(f"Failed to recycle browser context: {e}")
+            # Drop the closed handles so the next navigation opens a fresh context
+            self._use_page(None)
+            self.context = None
+    
     def close_browser(self) -> None:
         """Close browser and cleanup"""
         try:
@@ -57,22 +214,49 @@ class PlaywrightController:
                 self.context.close()
             if self.browser:
                 self.browser.close()
-            if self.playwright:
+            if self.playwright and self._owns_playwright:
                 self.playwright.stop()
             
             logger.info("Browser closed")
             
         except Exception as e:
             logger.error(f"Error closing browser: {e}")
+        finally:
+            self._use_page(None)
+            self.context = None
+            self.browser = None
+            self.playwright = None
+            self._owns_playwright = False
     
-    def navigate_to(self, url: str) -> bool:
-        """Navigate to URL"""
+    @contextmanager
+    def page_scope(self) -> Iterator[Page]:
+        """Run the block on a fresh page in the current context and close it afterwards"""
+        if not self.context:
+            self.start_browser()
+        
+        previous_page = self.page
+        self._use_page(self._new_page())
+        try:
+            yield self.page
+        finally:
+            try:
+                self.page.close()
+            except Exception as e:
+                logger.error(f"Error closing page: {e}")
+            self._use_page(previous_page)
+    
+    def navigate_to(self, url: str, wait_state: str = "domcontentloaded") -> bool:
+        """Navigate to URL and wait for the given load state"""
         try:
             if not self.page:
-                self.start_browser()
+                if self.browser and self.browser.is_connected():
+                    self._open_context()
+                else:
+                    self.start_browser()
             
-            self.page.goto(url)
-            self.page.wait_for_load_state("networkidle")
+            self._locator.cache_clear()
+            # Late elements are handled by wait_for_element; "networkidle" adds an idle-timer tail
+            self.page.goto(url, wait_until=wait_state)
             
             logger.info(f"Navigated to: {url}")
             return True
@@ -95,43 +279,107 @@ class PlaywrightController:
             logger.error(f"Failed to get page HTML: {e}")
             return ""
     
-    def get_page_url(self) -> str:
-        """Get current page URL"""
+    def get_interactive_dom(self) -> str:
+        """Get a compact HTML projection of the page's interactive elements"""
         try:
             if not self.page:
-                return ""
-            return self.page.url
+                raise Exception("Browser not started")
+            
+            html = self.page.evaluate(_INTERACTIVE_DOM_JS)
+            logger.debug(f"Retrieved interactive DOM ({len(html)} chars)")
+            return html
+            
         except Exception as e:
-            logger.error(f"Failed to get page URL: {e}")
+            logger.error(f"Failed to get interactive DOM: {e}")
             return ""
     
-    def find_element(self, selector: str, selector_type: str = "xpath") -> bool:
-        """Check if element exists on page"""
+    def get_page_url(self) -> str:
+        """Get current page URL"""
+        # Page.url is tracked client-side from navigation events, so this is not a round-trip
+        return self.page.url if self.page else ""
+    
+    def find_element(self, selector: Selector, selector_type: str = "xpath",
+                     timeout_ms: Optional[int] = None) -> bool:
+        """Check if element exists on page, optionally waiting up to timeout_ms for it to attach"""
         try:
             if not self.page:
                 return False
             
-            if selector_type == "xpath":
-                element = self.page.locator(f"xpath={selector}")
-            else:
-                element = self.page.locator(selector)
+            if timeout_ms is not None:
+                self._locator(selector, selector_type).first.wait_for(state="attached", timeout=timeout_ms)
+                return True
+            
+            if selector_type == "xpath" and isinstance(selector, str):
+                return self.exists_xpath(selector)
             
-            return element.count() > 0
+            # .first stops at the first match instead of counting all of them
+            return self._locator(selector, selector_type).first.count() > 0
             
+        except PlaywrightTimeoutError:
+            return False
         except Exception as e:
             logger.error(f"Error finding element with selector {selector}: {e}")
             return False
     
-    def click_element(self, selector: str, selector_type: str = "xpath") -> bool:
+    def is_unique(self, selector: Selector, selector_type: str = "xpath") -> bool:
+        """Check that a selector matches exactly one element, as strict-mode actions require"""
+        try:
+            if not self.page:
+                return False
+            
+            return self._locator(selector, selector_type).count() == 1
+            
+        except Exception as e:
+            logger.error(f"Error counting elements for selector {selector}: {e}")
+            return False
+    
+    def exists_xpath(self, xpath: str) -> bool:
+        """Check if an XPath matches any element, stopping at the first hit"""
+        try:
+            if not self.page:
+                return False
+            
+            return self.page.evaluate(_EXISTS_XPATH_JS, xpath)
+            
+        except Exception as e:
+            logger.error(f"Error evaluating XPath {xpath}: {e}")
+            return False
+    
+    def find_first_matching_xpath(self, xpaths: List[str]) -> int:
+        """Return the index of the first XPath that matches an element, or -1"""
+        try:
+            if not self.page or not xpaths:
+                return -1
+            
+            # Probe every candidate in one round-trip instead of one locator query each
+            return self.page.evaluate(_FIRST_MATCHING_XPATH_JS, xpaths)
+            
+        except Exception as e:
+            logger.error(f"Error probing XPath variations: {e}")
+            return -1
+    
+    def verify_texts_present(self, texts: List[str]) -> List[bool]:
+        """Check which texts appear in the page's rendered text, in one evaluation"""
+        try:
+            if not self.page:
+                return [False] * len(texts)
+            
+            return self.page.evaluate(
+                "(needles) => { const text = document.body.innerText; return needles.map(n => text.includes(n)); }",
+                texts
+            )
+            
+        except Exception as e:
+            logger.error(f"Error verifying page text: {e}")
+            return [False] * len(texts)
+    
+    def click_element(self, selector: Selector, selector_type: str = "xpath") -> bool:
         """Click element by selector"""
         try:
             if not self.page:
                 return False
             
-            if selector_type == "xpath":
-                element = self.page.locator(f"xpath={selector}")
-            else:
-                element = self.page.locator(selector)
+            element = self._locator(selector, selector_type)
             
             element.click()
             logger.info(f"Clicked element: {selector}")
@@ -141,16 +389,13 @@ class PlaywrightController:
             logger.error(f"Failed to click element {selector}: {e}")
             return False
     
-    def type_text(self, selector: str, text: str, selector_type: str = "xpath") -> bool:
+    def type_text(self, selector: Selector, text: str, selector_type: str = "xpath") -> bool:
         """Type text into element"""
         try:
             if not self.page:
                 return False
             
-            if selector_type == "xpath":
-                element = self.page.locator(f"xpath={selector}")
-            else:
-                element = self.page.locator(selector)
+            element = self._locator(selector, selector_type)
             
             element.fill(text)
             logger.info(f"Typed text into element: {selector}")
@@ -160,16 +405,13 @@ class PlaywrightController:
             logger.error(f"Failed to type text into element {selector}: {e}")
             return False
     
-    def select_option(self, selector: str, option_text: str, selector_type: str = "xpath") -> bool:
+    def select_option(self, selector: Selector, option_text: str, selector_type: str = "xpath") -> bool:
         """Select option from dropdown"""
         try:
             if not self.page:
                 return False
             
-            if selector_type == "xpath":
-                element = self.page.locator(f"xpath={selector}")
-            else:
-                element = self.page.locator(selector)
+            element = self._locator(selector, selector_type)
             
             element.select_option(label=option_text)
             logger.info(f"Selected option '{option_text}' from: {selector}")
@@ -179,16 +421,13 @@ class PlaywrightController:
             logger.error(f"Failed to select option from {selector}: {e}")
             return False
     
-    def get_element_text(self, selector: str, selector_type: str = "xpath") -> str:
+    def get_element_text(self, selector: Selector, selector_type: str = "xpath") -> str:
         """Get text content of element"""
         try:
             if not self.page:
                 return ""
             
-            if selector_type == "xpath":
-                element = self.page.locator(f"xpath={selector}")
-            else:
-                element = self.page.locator(selector)
+            element = self._locator(selector, selector_type)
             
             text = element.inner_text()
             logger.debug(f"Got text from element {selector}: {text}")
@@ -198,18 +437,15 @@ class PlaywrightController:
             logger.error(f"Failed to get text from element {selector}: {e}")
             return ""
     
-    def wait_for_element(self, selector: str, selector_type: str = "xpath", timeout: int = None) -> bool:
+    def wait_for_element(self, selector: Selector, selector_type: str = "xpath", timeout: int = None) -> bool:
         """Wait for element to appear"""
         try:
             if not self.page:
                 return False
             
-            timeout = timeout or settings.timeout
+            timeout = timeout or get_settings().timeout
             
-            if selector_type == "xpath":
-                element = self.page.locator(f"xpath={selector}")
-            else:
-                element = self.page.locator(selector)
+            element = self._locator(selector, selector_type)
             
             element.wait_for(state="visible", timeout=timeout)
             logger.info(f"Element appeared: {selector}")
@@ -219,16 +455,13 @@ class PlaywrightController:
             logger.error(f"Timeout waiting for element {selector}: {e}")
             return False
     
-    def scroll_to_element(self, selector: str, selector_type: str = "xpath") -> bool:
+    def scroll_to_element(self, selector: Selector, selector_type: str = "xpath") -> bool:
         """Scroll to element"""
         try:
             if not self.page:
                 return False
             
-            if selector_type == "xpath":
-                element = self.page.locator(f"xpath={selector}")
-            else:
-                element = self.page.locator(selector)
+            element = self._locator(selector, selector_type)
             
             element.scroll_into_view_if_needed()
             logger.info(f"Scrolled to element: {selector}")
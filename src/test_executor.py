@@ -1,20 +1,34 @@
 """
 Test execution engine that coordinates all components
 """
+import queue
+import re
+import threading
 import time
-from typing import Dict, List, Optional, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Any, Tuple
 from dataclasses import dataclass
 from loguru import logger
 
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from cucumber_parser import CucumberParser, TestScenario, TestStep
 from ai_client import AIElementDetector
 from playwright_controller import PlaywrightController
 from element_cache import ElementCache
 from xpath_helpers import XPathHelper
+from config import get_settings
+
+
+_QUOTED_RE = re.compile(r'["\']([^"\']+)["\']')
+_TYPE_WORDS_RE = re.compile(r'type|enter|input')
+_VERIFY_WORDS_RE = re.compile(r'see|verify|check')
+
+# How long an AI-suggested selector gets to match before it is rejected
+AI_PROBE_TIMEOUT_MS = 200
 
 
 @dataclass
@@ -36,9 +50,26 @@ class TestExecutor:
     def __init__(self):
         self.cucumber_parser = CucumberParser()
         self.ai_detector = AIElementDetector()
-        self.playwright_controller = PlaywrightController()
+        self._main_controller = PlaywrightController()
+        self._thread_state = threading.local()
         self.element_cache = ElementCache()
         self.xpath_helper = XPathHelper()
+        self.prefetch_enabled = get_settings().ai_prefetch
+        self.context_recycle_interval = get_settings().context_recycle_interval
+        self.parallel_scenarios = get_settings().parallel_scenarios
+        
+        # Step handlers by parsed action; anything else goes through _handle_generic_step
+        self._handlers: Dict[str, Callable[[TestStep], bool]] = {
+            "navigate": self._handle_navigate_step,
+            "click": self._handle_click_step,
+            "type": self._handle_type_step,
+            "select": self._handle_select_step,
+            "verify": self._handle_verify_step,
+            "wait": self._handle_wait_step,
+        }
+        
+        # AI results resolved ahead of time, keyed by (url, element description)
+        self._prefetched: Dict[Tuple[str, str], Dict[str, Any]] = {}
         
         # Statistics
         self.total_scenarios = 0
@@ -46,6 +77,13 @@ class TestExecutor:
         self.failed_scenarios = 0
         self.cache_hits = 0
         self.ai_calls = 0
+        # Worker threads update the statistics concurrently
+        self._stats_lock = threading.Lock()
+    
+    @property
+    def playwright_controller(self) -> PlaywrightController:
+        """Controller for the current thread (parallel workers each own a browser)"""
+        return getattr(self._thread_state, "controller", None) or self._main_controller
     
     def execute_feature_file(self, feature_file_path: str) -> List[TestResult]:
         """Execute all scenarios in a feature file"""
@@ -56,16 +94,10 @@ class TestExecutor:
             scenarios = self.cucumber_parser.parse_feature_file(feature_file_path)
             self.total_scenarios = len(scenarios)
             
-            # Execute each scenario
-            results = []
-            for scenario in scenarios:
-                result = self.execute_scenario(scenario)
-                results.append(result)
-                
-                if result.passed:
-                    self.passed_scenarios += 1
-                else:
-                    self.failed_scenarios += 1
+            if self.parallel_scenarios > 1 and len(scenarios) > 1:
+                results = self._execute_scenarios_parallel(scenarios)
+            else:
+                results = self._execute_scenarios_serial(scenarios)
             
             # Print summary
             self._print_execution_summary(results)
@@ -76,7 +108,77 @@ class TestExecutor:
             logger.error(f"Failed to execute feature file: {e}")
             return []
         finally:
-            self.playwright_controller.close_browser()
+            # Appends are buffered between flush intervals; persist them before returning
+            self.element_cache.flush()
+    
+    def _execute_scenarios_serial(self, scenarios: List[TestScenario]) -> List[TestResult]:
+        """Execute scenarios one after another in a shared browser"""
+        results = []
+        
+        # The browser is closed even if execution raises
+        with self.playwright_controller:
+            for index, scenario in enumerate(scenarios, start=1):
+                result = self.execute_scenario(scenario)
+                results.append(result)
+                self._record_result(result)
+                
+                # Bound browser memory on long feature files
+                if self.context_recycle_interval and index % self.context_recycle_interval == 0 and index < len(scenarios):
+                    self.playwright_controller.recycle_context()
+        
+        return results
+    
+    def _execute_scenarios_parallel(self, scenarios: List[TestScenario]) -> List[TestResult]:
+        """Execute scenarios concurrently, one browser per worker thread"""
+        workers = min(self.parallel_scenarios, len(scenarios))
+        logger.info(f"Running {len(scenarios)} scenarios with {workers} workers")
+        results: List[Optional[TestResult]] = [None] * len(scenarios)
+        
+        pending: "queue.SimpleQueue[Tuple[int, TestScenario]]" = queue.SimpleQueue()
+        for item in enumerate(scenarios):
+            pending.put(item)
+        
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(self._run_worker, pending, results) for _ in range(workers)]
+            for future in futures:
+                future.result()
+        
+        return results
+    
+    def _run_worker(self, pending: "queue.SimpleQueue[Tuple[int, TestScenario]]",
+                    results: List[Optional[TestResult]]) -> None:
+        """Execute queued scenarios on a browser owned by the calling worker thread"""
+        # Playwright's sync API is bound to the thread that started it; the browser starts
+        # on the worker's first navigation and is reused for the rest of its scenarios
+        controller = PlaywrightController()
+        self._thread_state.controller = controller
+        executed = 0
+        try:
+            while True:
+                try:
+                    index, scenario = pending.get_nowait()
+                except queue.Empty:
+                    return
+                
+                # Bound browser memory, as in serial execution
+                if executed and self.context_recycle_interval and executed % self.context_recycle_interval == 0:
+                    controller.recycle_context()
+                
+                result = self.execute_scenario(scenario)
+                results[index] = result
+                executed += 1
+                self._record_result(result)
+        finally:
+            controller.close_browser()
+            self._thread_state.controller = None
+    
+    def _record_result(self, result: TestResult) -> None:
+        """Count a finished scenario"""
+        with self._stats_lock:
+            if result.passed:
+                self.passed_scenarios += 1
+            else:
+                self.failed_scenarios += 1
     
     def execute_scenario(self, scenario: TestScenario) -> TestResult:
         """Execute a single test scenario"""
@@ -89,24 +191,26 @@ class TestExecutor:
         failed_steps = []
         error_message = None
         
+        background_steps = scenario.background_steps or []
+        all_steps = background_steps + scenario.steps
+        
         try:
             # Execute background steps first
-            if scenario.background_steps:
-                for step in scenario.background_steps:
-                    success = self._execute_step(step)
-                    steps_executed += 1
-                    if success:
-                        steps_passed += 1
-                    else:
-                        steps_failed += 1
-                        failed_steps.append(f"Background: {step.step_text}")
+            for position, step, success in self._run_steps(background_steps):
+                steps_executed += 1
+                if success:
+                    steps_passed += 1
+                    self._maybe_prefetch(step, all_steps[position + 1:])
+                else:
+                    steps_failed += 1
+                    failed_steps.append(f"Background: {step.step_text}")
             
             # Execute scenario steps
-            for step in scenario.steps:
-                success = self._execute_step(step)
+            for position, step, success in self._run_steps(scenario.steps, start=len(background_steps)):
                 steps_executed += 1
                 if success:
                     steps_passed += 1
+                    self._maybe_prefetch(step, all_steps[position + 1:])
                 else:
                     steps_failed += 1
                     failed_steps.append(step.step_text)
@@ -133,39 +237,94 @@ class TestExecutor:
             failed_steps=failed_steps
         )
     
+    def _run_steps(self, steps: List[TestStep], start: int = 0) -> Iterator[Tuple[int, TestStep, bool]]:
+        """Execute steps in order, yielding (position, step, success); consecutive verify steps share one page evaluation"""
+        index = 0
+        while index < len(steps):
+            run_end = index
+            while run_end < len(steps) and steps[run_end].action == "verify" and steps[run_end].expected_text:
+                run_end += 1
+            
+            if run_end == index:
+                yield start + index, steps[index], self._execute_step(steps[index])
+                index += 1
+                continue
+            
+            run = steps[index:run_end]
+            for step in run:
+                logger.info(f"Executing step: {step.step_text}")
+            results = self.playwright_controller.verify_texts_present([step.expected_text for step in run])
+            for offset, (step, success) in enumerate(zip(run, results)):
+                yield start + index + offset, step, success
+            index = run_end
+    
     def _execute_step(self, step: TestStep) -> bool:
         """Execute a single test step"""
         logger.info(f"Executing step: {step.step_text}")
         
         try:
-            # Handle different step types
-            if step.action == "navigate":
-                return self._handle_navigate_step(step)
-            elif step.action == "click":
-                return self._handle_click_step(step)
-            elif step.action == "type":
-                return self._handle_type_step(step)
-            elif step.action == "select":
-                return self._handle_select_step(step)
-            elif step.action == "verify":
-                return self._handle_verify_step(step)
-            elif step.action == "wait":
-                return self._handle_wait_step(step)
-            else:
-                # Try to infer action from step text
-                return self._handle_generic_step(step)
-                
+            # Handle different step types, or try to infer action from step text
+            handler = self._handlers.get(step.action, self._handle_generic_step)
+            return handler(step)
+            
         except Exception as e:
             logger.error(f"Step execution failed: {e}")
             return False
     
+    def _maybe_prefetch(self, step: TestStep, upcoming_steps: List[TestStep]) -> None:
+        """Prefetch AI selectors for the steps following a successful navigation"""
+        if not self.prefetch_enabled or step.action != "navigate":
+            return
+        try:
+            self._prefetch_ai_selectors(upcoming_steps)
+        except Exception as e:
+            # Steps will fall back to resolving their selectors one at a time
+            logger.warning(f"AI selector prefetch failed: {e}")
+    
+    def _prefetch_ai_selectors(self, steps: List[TestStep]) -> None:
+        """Resolve AI selectors for upcoming steps on the current page in one concurrent batch"""
+        current_url = self.playwright_controller.get_page_url()
+        
+        descriptions = []
+        for step in steps:
+            # Later steps run against a different page
+            if step.action == "navigate":
+                break
+            description = step.element_description
+            if not description or step.action == "verify" or description in descriptions:
+                continue
+            if (current_url, description) in self._prefetched:
+                continue
+            if self.element_cache.get(current_url, description):
+                continue
+            # Hits are cached, so the step itself will not probe the page again
+            if self._find_local_selector(description, current_url):
+                continue
+            descriptions.append(description)
+        
+        if not descriptions:
+            return
+        
+        logger.info(f"Prefetching AI selectors for {len(descriptions)} elements")
+        requests_sent = sum(
+            1 for description in descriptions if not self.ai_detector.is_memoized(current_url, description)
+        )
+        
+        html_content = self._get_ai_dom()
+        results = self.ai_detector.find_element_selectors_batch(
+            [(html_content, description, current_url) for description in descriptions]
+        )
+        with self._stats_lock:
+            self.ai_calls += requests_sent
+        for description, result in zip(descriptions, results):
+            self._prefetched[(current_url, description)] = result
+    
     def _handle_navigate_step(self, step: TestStep) -> bool:
         """Handle navigation steps"""
         url = step.element_description
         if not url:
             # Extract URL from step text
-            import re
-            url_match = re.search(r'["\']([^"\']+)["\']', step.step_text)
+            url_match = _QUOTED_RE.search(step.step_text)
             if url_match:
                 url = url_match.group(1)
         
@@ -216,9 +375,7 @@ class TestExecutor:
         if not step.expected_text:
             return False
         
-        # Try to find element containing the expected text
-        selector = f"//*[contains(text(),'{step.expected_text}')]"
-        return self.playwright_controller.find_element(selector, "xpath")
+        return self.playwright_controller.verify_texts_present([step.expected_text])[0]
     
     def _handle_wait_step(self, step: TestStep) -> bool:
         """Handle wait steps"""
@@ -242,11 +399,11 @@ class TestExecutor:
         # Try to infer action from step text
         if "click" in step_lower and step.element_description:
             return self._handle_click_step(step)
-        elif any(word in step_lower for word in ["type", "enter", "input"]) and step.element_description:
+        elif _TYPE_WORDS_RE.search(step_lower) and step.element_description:
             return self._handle_type_step(step)
         elif "select" in step_lower and step.element_description:
             return self._handle_select_step(step)
-        elif any(word in step_lower for word in ["see", "verify", "check"]):
+        elif _VERIFY_WORDS_RE.search(step_lower):
             return self._handle_verify_step(step)
         elif "navigate" in step_lower or "go to" in step_lower:
             return self._handle_navigate_step(step)
@@ -261,40 +418,94 @@ class TestExecutor:
         # Check cache first
         cached_result = self.element_cache.get(current_url, element_description)
         if cached_result:
-            self.cache_hits += 1
+            with self._stats_lock:
+                self.cache_hits += 1
             logger.info(f"Using cached selector for: {element_description}")
             return {
                 "selector": cached_result["selector"],
                 "type": cached_result["selector_type"]
             }
         
-        # Try smart XPath patterns first
-        xpath_variations = self.xpath_helper.generate_xpath_variations(element_description)
-        for xpath in xpath_variations:
-            if self.playwright_controller.find_element(xpath, "xpath"):
-                logger.info(f"Found element with pattern: {xpath}")
-                # Cache the successful selector
-                self.element_cache.set(current_url, element_description, xpath, "xpath")
-                return {"selector": xpath, "type": "xpath"}
+        # Try role locators and smart XPath patterns before AI
+        selector = self._find_local_selector(element_description, current_url)
+        if selector:
+            return selector
+        
+        # Use a prefetched AI result if one was resolved for this page
+        prefetched = self._prefetched.pop((current_url, element_description), None)
+        if prefetched:
+            selector = self._validate_ai_result(prefetched, current_url, element_description)
+            if selector:
+                return selector
         
         # Use AI analysis as fallback
         logger.info(f"Using AI analysis for: {element_description}")
-        self.ai_calls += 1
+        with self._stats_lock:
+            self.ai_calls += 1
         
-        html_content = self.playwright_controller.get_page_html()
+        html_content = self._get_ai_dom()
         ai_result = self.ai_detector.find_element_selector(html_content, element_description, current_url)
         
+        selector = self._validate_ai_result(ai_result, current_url, element_description)
+        if selector:
+            return selector
+        
+        logger.error(f"Could not find selector for: {element_description}")
+        return None
+    
+    def _get_ai_dom(self) -> str:
+        """Get the DOM to send for AI analysis, preferring the interactive-element projection"""
+        return self.playwright_controller.get_interactive_dom() or self.playwright_controller.get_page_html()
+    
+    def _find_local_selector(self, element_description: str, current_url: str) -> Optional[Dict[str, str]]:
+        """Find a selector without AI, trying role locators then XPath patterns, and cache it"""
+        role_selector = self._find_role_selector(element_description)
+        if role_selector:
+            logger.info(f"Found element by role: {role_selector}")
+            self.element_cache.set(current_url, element_description, role_selector, "role")
+            return {"selector": role_selector, "type": "role"}
+        
+        xpath = self._find_pattern_selector(element_description)
+        if xpath:
+            logger.info(f"Found element with pattern: {xpath}")
+            # Cache the successful selector
+            self.element_cache.set(current_url, element_description, xpath, "xpath")
+            return {"selector": xpath, "type": "xpath"}
+        return None
+    
+    def _find_role_selector(self, element_description: str) -> Optional[str]:
+        """Return a "role:name" selector that matches an element on the page"""
+        for role_selector in self.xpath_helper.generate_role_variations(element_description):
+            # An ambiguous name would fail strict mode on the action and poison the cache
+            if self.playwright_controller.is_unique(role_selector, "role"):
+                return role_selector
+        return None
+    
+    def _find_pattern_selector(self, element_description: str) -> Optional[str]:
+        """Return a smart XPath pattern that matches an element on the page"""
+        xpath_variations = self.xpath_helper.generate_xpath_variations(element_description)
+        
+        # All variations are probed in one round-trip; the most specific match wins
+        index = self.playwright_controller.find_first_matching_xpath(xpath_variations)
+        if index >= 0:
+            return xpath_variations[index]
+        return None
+    
+    def _validate_ai_result(self, ai_result: Dict[str, Any], current_url: str,
+                            element_description: str) -> Optional[Dict[str, str]]:
+        """Check an AI-suggested selector against the page and cache it on success"""
         if ai_result["success"] and ai_result["best_selector"]:
             selector = ai_result["best_selector"]
             selector_type = "xpath" if selector.startswith("//") or selector.startswith("xpath=") else "css"
             
-            # Test the selector
-            if self.playwright_controller.find_element(selector, selector_type):
+            # Test the selector; a wrong suggestion should fail fast, not after the full timeout
+            if self.playwright_controller.find_element(selector, selector_type, timeout_ms=AI_PROBE_TIMEOUT_MS):
                 # Cache the successful selector
                 self.element_cache.set(current_url, element_description, selector, selector_type)
                 return {"selector": selector, "type": selector_type}
         
-        logger.error(f"Could not find selector for: {element_description}")
+        # Let the next lookup re-analyze the page instead of reusing this result
+        self.ai_detector.forget(current_url, element_description)
         return None
     
     def _print_execution_summary(self, results: List[TestResult]) -> None:
@@ -303,10 +514,16 @@ class TestExecutor:
         logger.info("TEST EXECUTION SUMMARY")
         logger.info("=" * 60)
         
-        total_time = sum(result.execution_time for result in results)
-        total_steps = sum(result.steps_executed for result in results)
-        total_passed_steps = sum(result.steps_passed for result in results)
-        total_failed_steps = sum(result.steps_failed for result in results)
+        total_time = 0.0
+        total_steps = total_passed_steps = total_failed_steps = 0
+        failed_results = []
+        for result in results:
+            total_time += result.execution_time
+            total_steps += result.steps_executed
+            total_passed_steps += result.steps_passed
+            total_failed_steps += result.steps_failed
+            if not result.passed:
+                failed_results.append(result)
         
         logger.info(f"Total Scenarios: {self.total_scenarios}")
         logger.info(f"Passed Scenarios: {self.passed_scenarios}")
@@ -318,13 +535,11 @@ class TestExecutor:
         logger.info(f"Cache Hits: {self.cache_hits}")
         logger.info(f"AI Calls: {self.ai_calls}")
         
-        if self.failed_scenarios > 0:
+        if failed_results:
             logger.info("\nFAILED SCENARIOS:")
-            for result in results:
-                if not result.passed:
-                    logger.info(f"  - {result.scenario_name}")
-                    if result.failed_steps:
-                        for failed_step in result.failed_steps:
-                            logger.info(f"    * {failed_step}")
+            for result in failed_results:
+                logger.info(f"  - {result.scenario_name}")
+                for failed_step in result.failed_steps or ():
+                    logger.info(f"    * {failed_step}")
         
         logger.info("=" * 60)
\ No newline at end of file
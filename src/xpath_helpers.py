@@ -1,108 +1,175 @@
 """
 Smart XPath helpers for common UI patterns
 """
-from typing import List, Dict, Optional
+import re
+from functools import lru_cache
+from types import MappingProxyType
+from typing import List, Mapping, Tuple
+
+
+COMMON_PATTERNS: Mapping[str, str] = MappingProxyType({
+    "button_text": "//button[text()='{}']",
+    "button_contains": "//button[contains(text(),'{}')]",
+    "link_text": "//a[text()='{}']",
+    "link_contains": "//a[contains(text(),'{}')]",
+    "input_placeholder": "//input[@placeholder='{}']",
+    "input_name": "//input[@name='{}']",
+    "input_id": "//input[@id='{}']",
+    "element_text": "//*[contains(text(),'{}')]",
+    "element_class": "//*[@class='{}']",
+    "element_id": "//*[@id='{}']"
+})
+
+_NAMED_TAG_RE = re.compile(r'\b(button|link|input)\b')
+
+# Description keyword -> ARIA role for the get_by_role tier tried before the XPaths
+_ROLE_KEYWORDS: Mapping[str, str] = MappingProxyType({
+    "button": "button",
+    "link": "link",
+    "input": "textbox",
+    "field": "textbox"
+})
+
+
+def xpath_literal(value: str) -> str:
+    """Quote a string as an XPath literal, handling embedded quotes"""
+    if "'" not in value:
+        return f"'{value}'"
+    if '"' not in value:
+        return f'"{value}"'
+    # XPath 1.0 has no escape sequences: splice the apostrophes in with concat()
+    parts = value.split("'")
+    return "concat(" + ", \"'\", ".join(f"'{part}'" for part in parts) + ")"
 
 
 class XPathHelper:
     """Common XPath patterns for UI elements"""
     
+    @staticmethod
+    def xpath_literal(value: str) -> str:
+        """Quote a string as an XPath literal"""
+        return xpath_literal(value)
+    
     @staticmethod
     def button_by_text(text: str) -> str:
         """Find button by exact text"""
-        return f"//button[text()='{text}']"
+        return f"//button[text()={xpath_literal(text)}]"
     
     @staticmethod
     def button_by_partial_text(text: str) -> str:
         """Find button by partial text"""
-        return f"//button[contains(text(),'{text}')]"
+        return f"//button[contains(text(),{xpath_literal(text)})]"
     
     @staticmethod
     def link_by_text(text: str) -> str:
         """Find link by exact text"""
-        return f"//a[text()='{text}']"
+        return f"//a[text()={xpath_literal(text)}]"
     
     @staticmethod
     def link_by_partial_text(text: str) -> str:
         """Find link by partial text"""
-        return f"//a[contains(text(),'{text}')]"
+        return f"//a[contains(text(),{xpath_literal(text)})]"
     
     @staticmethod
     def input_by_placeholder(placeholder: str) -> str:
         """Find input by placeholder"""
-        return f"//input[@placeholder='{placeholder}']"
+        return f"//input[@placeholder={xpath_literal(placeholder)}]"
     
     @staticmethod
     def input_by_label(label: str) -> str:
         """Find input by associated label"""
-        return f"//input[@id=//label[text()='{label}']/@for]"
+        return f"//input[@id=//label[text()={xpath_literal(label)}]/@for]"
     
     @staticmethod
     def select_by_label(label: str) -> str:
         """Find select by associated label"""
-        return f"//select[@id=//label[text()='{label}']/@for]"
+        return f"//select[@id=//label[text()={xpath_literal(label)}]/@for]"
     
     @staticmethod
     def element_by_text(text: str) -> str:
         """Find any element containing text"""
-        return f"//*[contains(text(),'{text}')]"
+        return f"//*[contains(text(),{xpath_literal(text)})]"
     
     @staticmethod
     def element_by_attribute(tag: str, attr: str, value: str) -> str:
         """Find element by attribute"""
-        return f"//{tag}[@{attr}='{value}']"
+        return f"//{tag}[@{attr}={xpath_literal(value)}]"
     
     @staticmethod
-    def get_common_patterns() -> Dict[str, str]:
+    def get_common_patterns() -> Mapping[str, str]:
         """Get dictionary of common patterns"""
-        return {
-            "button_text": "//button[text()='{}']",
-            "button_contains": "//button[contains(text(),'{}')]",
-            "link_text": "//a[text()='{}']",
-            "link_contains": "//a[contains(text(),'{}')]",
-            "input_placeholder": "//input[@placeholder='{}']",
-            "input_name": "//input[@name='{}']",
-            "input_id": "//input[@id='{}']",
-            "element_text": "//*[contains(text(),'{}')]",
-            "element_class": "//*[@class='{}']",
-            "element_id": "//*[@id='{}']"
-        }
+        return COMMON_PATTERNS
     
     @staticmethod
     def generate_xpath_variations(element_description: str) -> List[str]:
         """Generate multiple XPath variations for an element description"""
-        variations = []
-        text = element_description.strip()
-        
-        # Button variations
-        if "button" in text.lower():
-            button_text = text.replace("button", "").strip()
-            variations.extend([
-                f"//button[text()='{button_text}']",
-                f"//button[contains(text(),'{button_text}')]",
-                f"//input[@type='button' and @value='{button_text}']",
-                f"//input[@type='submit' and @value='{button_text}']"
-            ])
-        
-        # Link variations
-        if "link" in text.lower():
-            link_text = text.replace("link", "").strip()
-            variations.extend([
-                f"//a[text()='{link_text}']",
-                f"//a[contains(text(),'{link_text}')]"
-            ])
-        
-        # Input variations
-        if "input" in text.lower() or "field" in text.lower():
-            field_name = text.replace("input", "").replace("field", "").strip()
-            variations.extend([
-                f"//input[@placeholder='{field_name}']",
-                f"//input[@name='{field_name}']",
-                f"//input[@id='{field_name}']",
-                f"//input[@id=//label[text()='{field_name}']/@for]"
-            ])
-        
-        # Generic text search
-        variations.append(f"//*[contains(text(),'{text}')]")
-        
-        return variations
\ No newline at end of file
+        return list(_xpath_variations(element_description))
+    
+    @staticmethod
+    def generate_role_variations(element_description: str) -> List[str]:
+        """Generate "role:name" selectors for PlaywrightController's role selector type"""
+        return list(_role_variations(element_description))
+
+
+@lru_cache(maxsize=1024)
+def _role_variations(element_description: str) -> Tuple[str, ...]:
+    """Build role selectors for an element description (memoized)"""
+    variations = []
+    text = element_description.strip()
+    lower_text = text.lower()
+    
+    for keyword, role in _ROLE_KEYWORDS.items():
+        if keyword in lower_text:
+            name = text
+            # Strip every keyword that maps to this role, like the XPath branches do
+            for other, other_role in _ROLE_KEYWORDS.items():
+                if other_role == role:
+                    name = name.replace(other, "")
+            name = name.strip()
+            if name:
+                variations.append(f"{role}:{name}")
+    
+    return tuple(dict.fromkeys(variations))
+
+
+@lru_cache(maxsize=1024)
+def _xpath_variations(element_description: str) -> Tuple[str, ...]:
+    """Build XPath variations for an element description (memoized)"""
+    variations = []
+    text = element_description.strip()
+    lower_text = text.lower()
+    
+    # Button variations
+    if "button" in lower_text:
+        button_text = text.replace("button", "").strip()
+        variations.extend([
+            f"//button[text()={xpath_literal(button_text)}]",
+            f"//button[contains(text(),{xpath_literal(button_text)})]",
+            f"//input[@type='button' and @value={xpath_literal(button_text)}]",
+            f"//input[@type='submit' and @value={xpath_literal(button_text)}]"
+        ])
+    
+    # Link variations
+    if "link" in lower_text:
+        link_text = text.replace("link", "").strip()
+        variations.extend([
+            f"//a[text()={xpath_literal(link_text)}]",
+            f"//a[contains(text(),{xpath_literal(link_text)})]"
+        ])
+    
+    # Input variations
+    if "input" in lower_text or "field" in lower_text:
+        field_name = text.replace("input", "").replace("field", "").strip()
+        variations.extend([
+            f"//input[@placeholder={xpath_literal(field_name)}]",
+            f"//input[@name={xpath_literal(field_name)}]",
+            f"//input[@id={xpath_literal(field_name)}]",
+            f"//input[@id=//label[text()={xpath_literal(field_name)}]/@for]"
+        ])
+    
+    # Generic text search, unless the description already names the tag to look for
+    if not _NAMED_TAG_RE.search(lower_text):
+        variations.append(f"//*[contains(text(),{xpath_literal(text)})]")
+    
+    # Overlapping branches can emit the same expression twice
+    return tuple(dict.fromkeys(variations))
@@ -2,12 +2,13 @@
 """
 Test script to verify the application works
 """
+import json
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from src.cucumber_parser import CucumberParser
-from src.xpath_helpers import XPathHelper
+from src.xpath_helpers import XPathHelper, xpath_literal
 from src.element_cache import ElementCache
 
 def test_cucumber_parser():
@@ -21,16 +22,18 @@ def test_cucumber_parser():
     for scenario in scenarios:
         print(f"- {scenario.name} ({len(scenario.steps)} steps)")
     
-    # Get all elements
-    elements = parser.get_all_elements(scenarios)
+    # Get all elements and the actions summary in one traversal
+    elements, actions = parser.summarise(scenarios)
     print(f"Found {len(elements)} unique elements:")
     for element in elements:
         print(f"  - {element}")
-    
-    # Get actions summary
-    actions = parser.get_actions_summary(scenarios)
     print(f"Actions summary: {actions}")
     
+    # Column-based queries must agree with the scenario walk
+    feature = parser.parse_feature("examples/sample.feature")
+    assert sorted(parser.get_all_elements(feature)) == sorted(elements)
+    assert parser.get_actions_summary(feature) == actions
+    
     print("✅ Cucumber Parser test passed!\n")
 
 def test_xpath_helpers():
@@ -47,13 +50,19 @@ def test_xpath_helpers():
     variations = helper.generate_xpath_variations("Login button")
     print(f"XPath variations for 'Login button': {variations}")
     
+    # Test literal quoting
+    assert xpath_literal("Login") == "'Login'"
+    assert xpath_literal("user's name") == '"user\'s name"'
+    assert xpath_literal('say "it\'s"') == """concat('say "it', "'", 's"')"""
+    assert helper.generate_xpath_variations("user's name field")[0] == '//input[@placeholder="user\'s name"]'
+    
     print("✅ XPath Helpers test passed!\n")
 
 def test_element_cache():
     """Test element cache"""
     print("Testing Element Cache...")
     
-    cache = ElementCache("test_cache.json")
+    cache = ElementCache("test_cache.jsonl")
     
     # Test cache operations
     cache.set("http://example.com", "login button", "//button[text()='Login']", "xpath")
@@ -65,8 +74,43 @@ def test_element_cache():
     stats = cache.get_stats()
     print(f"Cache stats: {stats}")
     
+    # Replaying the log keeps the last write per key
+    cache.set("http://example.com", "login button", "#login", "css")
+    cache.close()
+    reloaded = ElementCache("test_cache.jsonl")
+    assert reloaded.get("http://example.com", "login button")["selector"] == "#login"
+    
+    # Compaction drops superseded records
+    reloaded.compact()
+    with open("test_cache.jsonl", "rb") as f:
+        assert len(f.readlines()) == 1
+    
+    # A torn trailing line loses only that record
+    reloaded.close()
+    with open("test_cache.jsonl", "ab") as f:
+        f.write(b'{"selector": "//a", "url"')
+    reloaded = ElementCache("test_cache.jsonl")
+    assert reloaded.get("http://example.com", "login button")["selector"] == "#login"
+    reloaded.set("http://example.com", "signup link", "//a[text()='Sign up']")
+    reloaded.close()
+    reloaded = ElementCache("test_cache.jsonl")
+    assert reloaded.get("http://example.com", "login button") is not None
+    assert reloaded.get("http://example.com", "signup link") is not None
+    
+    # A cache written in the old pretty-printed JSON format is migrated, not dropped
+    reloaded.close()
+    with open("test_cache.jsonl", "w") as f:
+        json.dump({"0f3a": {"selector": "#old", "selector_type": "css", "url": "http://example.com",
+                            "element_description": "old button", "metadata": {}}}, f, indent=2)
+    reloaded = ElementCache("test_cache.jsonl")
+    assert reloaded.get("http://example.com", "old button")["selector"] == "#old"
+    reloaded.close()
+    assert ElementCache("test_cache.jsonl").get("http://example.com", "old button") is not None
+    
     # Clean up
-    cache.clear_cache()
+    reloaded.clear_cache()
+    reloaded.close()
+    cache.close()
     
     print("✅ Element Cache test passed!\n")
 